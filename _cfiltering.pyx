@@ -0,0 +1,77 @@
+# cython: language_level=3
+# _cfiltering.pyx
+"""
+Compiled versions of the per-cell classes from filtering.py:
+ - ATMCell: typed header/payload fields, packed header key
+ - TokenBucket: per-flow policer behind TokenBucketBank, with unboxed double state
+Build in place with `python setup.py build_ext --inplace`; filtering.py uses
+these when the extension is importable and its pure-Python classes otherwise.
+"""
+
+cdef class ATMCell:
+    """Simple ATM cell representation (header + small payload)"""
+    cdef public int vpi
+    cdef public int vci
+    cdef public str payload
+    cdef public bint is_malicious
+    cdef public long long key
+
+    def __init__(self, vpi, vci, payload, is_malicious=False):
+        self.vpi = int(vpi)
+        self.vci = int(vci)
+        self.payload = str(payload)
+        self.is_malicious = bool(is_malicious)
+        self.key = (<long long>self.vpi << 16) | self.vci
+
+    @classmethod
+    def _raw(cls, int vpi, int vci, str payload, bint is_malicious):
+        """Build a cell from already-typed values, skipping the coercions (trusted callers only)"""
+        cdef ATMCell cell = cls.__new__(cls)
+        cell.vpi = vpi
+        cell.vci = vci
+        cell.payload = payload
+        cell.is_malicious = is_malicious
+        cell.key = (<long long>vpi << 16) | vci
+        return cell
+
+    def header(self):
+        return (self.vpi, self.vci)
+
+cdef class TokenBucket:
+    """Token bucket policer for a single flow (vpi,vci)"""
+    cdef public double rate
+    cdef public double capacity
+    cdef public double tokens
+    cdef double _last_time
+    cdef bint _started
+
+    def __init__(self, rate_tokens_per_sec, burst_capacity):
+        self.rate = float(rate_tokens_per_sec)
+        self.capacity = float(burst_capacity)
+        self.tokens = float(burst_capacity)
+        self._started = False
+
+    @property
+    def last_time(self):
+        return self._last_time if self._started else None
+
+    @last_time.setter
+    def last_time(self, value):
+        self._started = value is not None
+        if self._started:
+            self._last_time = value
+
+    cpdef bint allow(self, double now):
+        """Return True if token available (consume 1); else False"""
+        cdef double tokens
+        if not self._started:
+            self._last_time = now
+            self._started = True
+        elif now > self._last_time:  # no refill for cells sharing a timestamp
+            tokens = self.tokens + (now - self._last_time) * self.rate
+            self.tokens = tokens if tokens < self.capacity else self.capacity
+            self._last_time = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
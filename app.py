@@ -1,9 +1,10 @@
 # app.py
-import time, random, threading
-from collections import defaultdict
+import time, threading, queue
 from flask import Flask, render_template, request
 from flask_socketio import SocketIO, emit
-from filtering import ATMCell, HeaderRule, PayloadRule, ATMFilter
+import numpy as np
+from filtering import HeaderRule, PayloadRule, ATMFilter, N_STATS, stats_from_counts
+from traffic import generate_traffic_batches, payload_hit_table, payload_hits
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'secret!'
@@ -17,82 +18,84 @@ DEFAULT_POLICER_CFG = {
     (2,40): (30.0, 10.0)
 }
 
-# keep a reference to the running thread so we don't run multiple
-sim_thread = None
+# cells filtered per chunk; the emit clock is read once between chunks.
+# Every 'sim_update' carries the full stats snapshot, so tabs that join mid-run stay correct.
+EMIT_CHECK_CELLS = 1024
+
+# set while a simulation task is running so we don't run multiple
+sim_running = False
 sim_lock = threading.Lock()
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
-def traffic_generator(duration_sec, total_rate, malicious_fraction, seed=None):
-    if seed is not None:
-        random.seed(seed)
-    t = 0.0
-    dt = 1.0 / total_rate
-    while t < duration_sec:
-        vpi = random.choice([0,1,2])
-        vci = random.choice([10,20,30,40])
-        is_mal = random.random() < malicious_fraction
-        payload = "NORMALDATA"
-        if is_mal:
-            payload = "BADSIG_" + str(random.randint(0,999))
-        yield t, ATMCell(vpi, vci, payload, is_mal)
-        t += dt
+def emit_worker(q, poll_interval=0.05):
+    """
+    Drain (event, data) pairs from q and emit them via SocketIO, so JSON encoding
+    and socket writes stay off the simulation loop. Stops at the (None, None) sentinel.
+    Polls instead of blocking on q.get() so it also cooperates with eventlet.
+    """
+    while True:
+        try:
+            event, data = q.get_nowait()
+        except queue.Empty:
+            socketio.sleep(poll_interval)
+            continue
+        if event is None:
+            break
+        socketio.emit(event, data)
+        socketio.sleep(0)
 
 def run_simulation_emit(duration, rate, mal_frac, header_deny, sigs, policer_cfg, update_interval=0.5, seed=None):
     """
     Run the simulation and emit periodic stats via SocketIO.
     update_interval: seconds between socket emits (aggregates while running)
+    Updates are queued and sent by a background emit_worker task.
     """
-    atm_filter = ATMFilter(HeaderRule(header_deny), PayloadRule(sigs), policer_cfg)
-    stats = defaultdict(int)
-    now_base = time.time()
-    last_emit_time = now_base
-    batch_count = 0
-
-    for t_offset, cell in traffic_generator(duration, rate, mal_frac, seed):
-        now = now_base + t_offset
-        stats['total'] += 1
-        if cell.is_malicious: stats['mal_total'] += 1
-        else: stats['legit_total'] += 1
+    updates = queue.Queue()
+    socketio.start_background_task(emit_worker, updates)
+    try:
+        atm_filter = ATMFilter(HeaderRule(header_deny), PayloadRule(sigs), policer_cfg)
+        hit_table = payload_hit_table(atm_filter.payload_rule)
+        counts = np.zeros(N_STATS, dtype=np.int64)
+        now_base = time.time()
+        clock = time.monotonic
+        last_emit_time = clock()
+        batch_count = 0
 
-        action, reason = atm_filter.process(cell, now)
-        if action == "drop":
-            stats['dropped'] += 1
-            stats[f'dropped_{reason}'] += 1
-            if cell.is_malicious: stats['mal_dropped'] += 1
-            else: stats['legit_dropped'] += 1
-        else:
-            stats['forwarded'] += 1
-            if cell.is_malicious: stats['mal_forwarded'] += 1
-            else: stats['legit_forwarded'] += 1
+        # cells go through the compiled filter kernel EMIT_CHECK_CELLS at a time; between
+        # chunks the loop yields to the SocketIO server (so queued updates get flushed)
+        # and checks the emit clock
+        for times, vpi, vci, is_mal, sig_id in generate_traffic_batches(duration, rate, mal_frac, seed,
+                                                                        batch_size=EMIT_CHECK_CELLS):
+            atm_filter.count_batch(vpi, vci, payload_hits(hit_table, is_mal, sig_id), is_mal, now_base + times, counts)
+            socketio.sleep(0)
+            now_wall = clock()
+            if now_wall - last_emit_time >= update_interval:
+                updates.put_nowait(('sim_update', stats_from_counts(counts)))
+                last_emit_time = now_wall
+                batch_count += 1
 
-        # periodically emit aggregated stats so front-end gets live update
-        if time.time() - last_emit_time >= update_interval:
-            emit_stats = {
-                'total': stats.get('total',0),
-                'forwarded': stats.get('forwarded',0),
-                'dropped': stats.get('dropped',0),
-                'dropped_header': stats.get('dropped_header',0),
-                'dropped_policer': stats.get('dropped_policer',0),
-                'dropped_payload': stats.get('dropped_payload',0),
-                'mal_total': stats.get('mal_total',0),
-                'mal_forwarded': stats.get('mal_forwarded',0),
-                'mal_dropped': stats.get('mal_dropped',0),
-                'legit_total': stats.get('legit_total',0),
-                'legit_forwarded': stats.get('legit_forwarded',0),
-                'legit_dropped': stats.get('legit_dropped',0),
-            }
-            socketio.emit('sim_update', emit_stats)
-            last_emit_time = time.time()
-            batch_count += 1
+        # final emit
+        final = stats_from_counts(counts)
+        final['false_positive_rate'] = (final.get('legit_dropped',0)/final.get('legit_total',1)) if final.get('legit_total') else 0.0
+        final['false_negative_rate'] = (final.get('mal_forwarded',0)/final.get('mal_total',1)) if final.get('mal_total') else 0.0
+        updates.put(('sim_done', final))
+    except Exception as exc:
+        updates.put(('sim_error', {'msg': f'Simulation failed: {exc}'}))
+        raise
+    finally:
+        updates.put((None, None))  # always stop the emit worker
 
-    # final emit
-    final = dict(stats)
-    final['false_positive_rate'] = (final.get('legit_dropped',0)/final.get('legit_total',1)) if final.get('legit_total') else 0.0
-    final['false_negative_rate'] = (final.get('mal_forwarded',0)/final.get('mal_total',1)) if final.get('mal_total') else 0.0
-    socketio.emit('sim_done', final)
+def run_simulation_task(*args):
+    """Background-task wrapper around run_simulation_emit that clears sim_running when done"""
+    global sim_running
+    try:
+        run_simulation_emit(*args)
+    finally:
+        with sim_lock:
+            sim_running = False
 
 @socketio.on('start_sim')
 def handle_start_sim(data):
@@ -104,9 +107,9 @@ def handle_start_sim(data):
       seed: int | None
     }
     """
-    global sim_thread
+    global sim_running
     with sim_lock:
-        if sim_thread and sim_thread.is_alive():
+        if sim_running:
             emit('sim_error', {'msg': 'Simulation already running.'})
             return
         duration = float(data.get('duration',5.0))
@@ -118,10 +121,9 @@ def handle_start_sim(data):
         sigs = DEFAULT_SIGS
         policer_cfg = DEFAULT_POLICER_CFG
 
-        sim_thread = threading.Thread(target=run_simulation_emit,
-                                      args=(duration, rate, mal_frac, header_deny, sigs, policer_cfg, 0.5, seed),
-                                      daemon=True)
-        sim_thread.start()
+        sim_running = True
+        socketio.start_background_task(run_simulation_task,
+                                       duration, rate, mal_frac, header_deny, sigs, policer_cfg, 0.5, seed)
         emit('sim_started', {'msg':'Simulation started'})
 
 @socketio.on('connect')
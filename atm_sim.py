@@ -1,68 +1,30 @@
 # atm_sim.py
 """
 ATM filtering simulator:
- - generates mixed legitimate and malicious ATM cells
+ - generates mixed legitimate and malicious ATM cells (see traffic.py)
  - processes them with ATMFilter from filtering.py
  - collects stats and plots results
 """
 
-import random
 import time
-from collections import defaultdict
+import numpy as np
 import matplotlib.pyplot as plt
 import argparse
-from filtering import ATMCell, HeaderRule, PayloadRule, ATMFilter
-
-def generate_traffic(duration_sec=5.0, total_rate=200.0, malicious_fraction=0.1, seed=None):
-    """
-    Generator that yields (time_offset, ATMCell) up to duration_sec.
-    total_rate = cells per second (lambda). Inter-arrival = 1/total_rate.
-    We simulate deterministic spacing for reproducibility.
-    """
-    if seed is not None:
-        random.seed(seed)
-    t = 0.0
-    dt = 1.0 / total_rate
-    while t < duration_sec:
-        # choose some VPI/VCI pairs to simulate multiple flows
-        vpi = random.choice([0,1,2])
-        vci = random.choice([10,20,30,40])
-        is_mal = random.random() < malicious_fraction
-        payload = "NORMALDATA"
-        if is_mal:
-            payload = "BADSIG_" + str(random.randint(0,999))
-        yield t, ATMCell(vpi, vci, payload, is_mal)
-        t += dt
+from filtering import HeaderRule, PayloadRule, ATMFilter, N_STATS, stats_from_counts
+from traffic import generate_traffic, generate_traffic_batches, payload_hit_table, payload_hits
 
 def run_simulation(duration=5.0, rate=200.0, mal_frac=0.10, header_deny=None, signatures=None, policer_cfg=None, seed=None):
     header = HeaderRule(deny_list=header_deny)
     payload = PayloadRule(signatures=signatures)
     atm_filter = ATMFilter(header, payload, policer_cfg)
 
-    stats = defaultdict(int)
+    counts = np.zeros(N_STATS, dtype=np.int64)
+    hit_table = payload_hit_table(payload)
     now_base = time.time()
-    for t_offset, cell in generate_traffic(duration, rate, mal_frac, seed=seed):
-        now = now_base + t_offset
-        stats['total'] += 1
-        if cell.is_malicious:
-            stats['mal_total'] += 1
-        else:
-            stats['legit_total'] += 1
-
-        action, reason = atm_filter.process(cell, now)
-        if action == "drop":
-            stats['dropped'] += 1
-            stats[f'dropped_{reason}'] += 1
-            if cell.is_malicious:
-                stats['mal_dropped'] += 1
-            else:
-                stats['legit_dropped'] += 1
-        else:
-            stats['forwarded'] += 1
-            if cell.is_malicious:
-                stats['mal_forwarded'] += 1
-            else:
-                stats['legit_forwarded'] += 1
+    for times, vpi, vci, is_mal, sig_id in generate_traffic_batches(duration, rate, mal_frac, seed=seed):
+        hit = payload_hits(hit_table, is_mal, sig_id)
+        atm_filter.count_batch(vpi, vci, hit, is_mal, now_base + times, counts)
+    stats = stats_from_counts(counts)
     # compute derived metrics safely
     stats['false_positive_rate'] = (stats['legit_dropped'] / stats['legit_total']) if stats.get('legit_total') else 0.0
     stats['false_negative_rate'] = (stats['mal_forwarded'] / stats['mal_total']) if stats.get('mal_total') else 0.0
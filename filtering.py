@@ -5,59 +5,163 @@ Core ATM filtering components:
  - HeaderRule: deny list for (VPI,VCI)
  - PayloadRule: signature-based payload matching
  - TokenBucket: per-(VPI,VCI) policer
+ - TokenBucketBank: all per-flow policers, indexed by flow id
  - ATMFilter: applies rules in order
+ATMCell and TokenBucket are replaced by their compiled versions from
+_cfiltering.pyx when that extension has been built (see setup.py).
 """
 
-import time
+import re
 from collections import defaultdict
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; the kernels then run as plain Python
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+# action / reason codes used by the batched path (ATMFilter.process_batch)
+ACTION_FORWARD, ACTION_DROP = 0, 1
+REASON_NONE, REASON_HEADER, REASON_POLICER, REASON_PAYLOAD = 0, 1, 2, 3
+REASON_NAMES = (None, 'header', 'policer', 'payload')
+
+# simulation counters produced by ATMFilter.count_batch, indexed by these codes
+STAT_NAMES = ('total', 'mal_total', 'legit_total',
+              'dropped', 'dropped_header', 'dropped_policer', 'dropped_payload',
+              'mal_dropped', 'legit_dropped',
+              'forwarded', 'mal_forwarded', 'legit_forwarded')
+(STAT_TOTAL, STAT_MAL_TOTAL, STAT_LEGIT_TOTAL,
+ STAT_DROPPED, STAT_DROPPED_HEADER, STAT_DROPPED_POLICER, STAT_DROPPED_PAYLOAD,
+ STAT_MAL_DROPPED, STAT_LEGIT_DROPPED,
+ STAT_FORWARDED, STAT_MAL_FORWARDED, STAT_LEGIT_FORWARDED) = range(len(STAT_NAMES))
+N_STATS = 16  # room for more counters without changing the kernel signature
+
+def pack_key(vpi:int, vci:int) -> int:
+    """Pack a (vpi, vci) header into one int key: (vpi << 16) | vci"""
+    return (int(vpi) << 16) | int(vci)
+
+def pack_keys(vpi, vci):
+    """Pack (vpi, vci) arrays into one int64 key per cell: (vpi << 16) | vci"""
+    return (np.asarray(vpi, dtype=np.int64) << 16) | np.asarray(vci, dtype=np.int64)
 
 class ATMCell:
     """Simple ATM cell representation (header + small payload)"""
+    __slots__ = ('vpi', 'vci', 'payload', 'is_malicious', 'key')
+
     def __init__(self, vpi:int, vci:int, payload:str, is_malicious:bool=False):
         self.vpi = int(vpi)
         self.vci = int(vci)
         self.payload = str(payload)
         self.is_malicious = bool(is_malicious)
-        self.timestamp = time.time()
+        self.key = (self.vpi << 16) | self.vci
+
+    @classmethod
+    def _raw(cls, vpi:int, vci:int, payload:str, is_malicious:bool):
+        """Build a cell from already-typed values, skipping the coercions (trusted callers only)"""
+        cell = cls.__new__(cls)
+        cell.vpi = vpi
+        cell.vci = vci
+        cell.payload = payload
+        cell.is_malicious = is_malicious
+        cell.key = (vpi << 16) | vci
+        return cell
 
     def header(self):
         return (self.vpi, self.vci)
 
 class HeaderRule:
-    """Denylist of (vpi, vci) pairs"""
+    """
+    Denylist of (vpi, vci) pairs, stored as packed int keys (see pack_key).
+    Lists longer than BITMAP_THRESHOLD are also frozen into a bitmap over the
+    24-bit UNI header space (VPI 8b + VCI 16b), so lookups need no hashing.
+    """
+    BITMAP_THRESHOLD = 64
+    BITMAP_KEYS = 1 << 24
+
     def __init__(self, deny_list=None):
-        self.deny_list = set(deny_list) if deny_list else set()
+        self.deny_set = {pack_key(v, c) for v, c in deny_list} if deny_list else set()
+        self._bits = None
+        self._sync_bitmap()
+
+    def _sync_bitmap(self):
+        if len(self.deny_set) <= self.BITMAP_THRESHOLD:
+            self._bits = None
+        elif self._bits is None:
+            self._bits = bytearray(self.BITMAP_KEYS >> 3)
+            for k in self.deny_set:
+                if 0 <= k < self.BITMAP_KEYS:
+                    self._bits[k >> 3] |= 1 << (k & 7)
 
     def check(self, cell:ATMCell) -> bool:
         """Return True if cell should be blocked by header rule"""
-        return cell.header() in self.deny_list
+        k = cell.key
+        if self._bits is not None and 0 <= k < self.BITMAP_KEYS:
+            return bool((self._bits[k >> 3] >> (k & 7)) & 1)
+        return k in self.deny_set
+
+    def deny_keys(self):
+        """Denied headers as an int64 array of packed keys"""
+        return np.fromiter(self.deny_set, dtype=np.int64, count=len(self.deny_set))
+
+    def deny_mask(self, keys):
+        """Bool array: True where the packed key is denied"""
+        if self._bits is None:
+            return np.isin(keys, self.deny_keys())
+        bits = np.frombuffer(self._bits, dtype=np.uint8)
+        in_map = (keys >= 0) & (keys < self.BITMAP_KEYS)
+        k = np.where(in_map, keys, 0)
+        mask = ((bits[k >> 3] >> (k & 7)) & 1).astype(bool) & in_map
+        if not in_map.all():
+            mask |= ~in_map & np.isin(keys, self.deny_keys())
+        return mask
 
     def add(self, vpi_vci):
-        self.deny_list.add(tuple(vpi_vci))
+        k = pack_key(*vpi_vci)
+        self.deny_set.add(k)
+        if self._bits is not None and 0 <= k < self.BITMAP_KEYS:
+            self._bits[k >> 3] |= 1 << (k & 7)
+        self._sync_bitmap()
 
     def remove(self, vpi_vci):
-        self.deny_list.discard(tuple(vpi_vci))
+        k = pack_key(*vpi_vci)
+        self.deny_set.discard(k)
+        if self._bits is not None and 0 <= k < self.BITMAP_KEYS:
+            self._bits[k >> 3] &= ~(1 << (k & 7)) & 0xFF
+        self._sync_bitmap()
 
 class PayloadRule:
-    """Signature based payload rule"""
+    """Signature based payload rule (all signatures compiled into one regex alternation)"""
     def __init__(self, signatures=None):
         self.signatures = list(signatures) if signatures else []
+        self._compile()
+
+    def _compile(self):
+        # one C-level scan per payload instead of one `sig in payload` per signature
+        self._pattern = re.compile("|".join(map(re.escape, self.signatures))) if self.signatures else None
 
     def check(self, cell:ATMCell) -> bool:
         """Return True if any signature is found in payload"""
-        for sig in self.signatures:
-            if sig in cell.payload:
-                return True
-        return False
+        return self.matches(cell.payload)
+
+    def matches(self, payload:str) -> bool:
+        """Return True if any signature is found in the raw payload string"""
+        return self._pattern is not None and self._pattern.search(payload) is not None
 
     def add_signature(self, signature:str):
         self.signatures.append(signature)
+        self._compile()
 
     def remove_signature(self, signature:str):
         self.signatures = [s for s in self.signatures if s != signature]
+        self._compile()
 
 class TokenBucket:
     """Token bucket policer for a single flow (vpi,vci)"""
+    __slots__ = ('rate', 'capacity', 'tokens', 'last_time')
+
     def __init__(self, rate_tokens_per_sec:float, burst_capacity:float):
         self.rate = float(rate_tokens_per_sec)
         self.capacity = float(burst_capacity)
@@ -66,17 +170,114 @@ class TokenBucket:
 
     def allow(self, now:float) -> bool:
         """Return True if token available (consume 1); else False"""
-        if self.last_time is None:
+        last = self.last_time
+        if last is None:
             self.last_time = now
-        elapsed = now - self.last_time
-        if elapsed > 0:
-            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        elif now > last:  # no refill for cells sharing a timestamp
+            tokens = self.tokens + (now - last) * self.rate
+            self.tokens = tokens if tokens < self.capacity else self.capacity
             self.last_time = now
         if self.tokens >= 1.0:
             self.tokens -= 1.0
             return True
         return False
 
+@njit(cache=True)
+def _bucket_take(f, now, rate, capacity, tokens, last_time):
+    # refill bucket f up to now, then try to consume one token
+    if np.isnan(last_time[f]):
+        last_time[f] = now
+    elif now > last_time[f]:
+        refilled = tokens[f] + (now - last_time[f]) * rate[f]
+        tokens[f] = refilled if refilled < capacity[f] else capacity[f]
+        last_time[f] = now
+    if tokens[f] >= 1.0:
+        tokens[f] -= 1.0
+        return True
+    return False
+
+@njit(cache=True)
+def _bank_allow(flow_ids, times, rate, capacity, tokens, last_time, allowed):
+    # sequential on purpose: each cell sees the bucket state left by the previous one
+    for i in range(flow_ids.shape[0]):
+        f = flow_ids[i]
+        allowed[i] = f < 0 or _bucket_take(f, times[i], rate, capacity, tokens, last_time)
+
+@njit(cache=True)
+def _count_kernel(header_drop, flow_ids, payload_hit, is_mal, times,
+                  rate, capacity, tokens, last_time, counts):
+    # fused per-cell filter loop: verdict + stats counters, no per-cell arrays
+    for i in range(flow_ids.shape[0]):
+        mal = is_mal[i]
+        counts[STAT_TOTAL] += 1
+        counts[STAT_MAL_TOTAL if mal else STAT_LEGIT_TOTAL] += 1
+        if header_drop[i]:
+            drop = STAT_DROPPED_HEADER
+        elif flow_ids[i] >= 0 and not _bucket_take(flow_ids[i], times[i], rate, capacity, tokens, last_time):
+            drop = STAT_DROPPED_POLICER
+        elif payload_hit[i]:
+            drop = STAT_DROPPED_PAYLOAD
+        else:
+            drop = -1
+        if drop >= 0:
+            counts[STAT_DROPPED] += 1
+            counts[drop] += 1
+            counts[STAT_MAL_DROPPED if mal else STAT_LEGIT_DROPPED] += 1
+        else:
+            counts[STAT_FORWARDED] += 1
+            counts[STAT_MAL_FORWARDED if mal else STAT_LEGIT_FORWARDED] += 1
+
+class TokenBucketBank:
+    """
+    Token bucket policers for many flows, indexed by a compact flow id (0..F-1).
+    Each flow's state lives in its TokenBucket (buckets[flow_id]), which the
+    per-cell path calls directly; batched calls copy that state (rate and capacity
+    included) into float64 arrays for the compiled kernel and write the tokens back
+    afterwards (O(F) per batch).
+    """
+    def __init__(self, rates, capacities):
+        self.buckets = [TokenBucket(r, b) for r, b in zip(rates, capacities)]
+
+    def __len__(self):
+        return len(self.buckets)
+
+    def _load(self):
+        rate = np.array([b.rate for b in self.buckets], dtype=np.float64)
+        capacity = np.array([b.capacity for b in self.buckets], dtype=np.float64)
+        tokens = np.array([b.tokens for b in self.buckets], dtype=np.float64)
+        last_time = np.array([np.nan if b.last_time is None else b.last_time for b in self.buckets], dtype=np.float64)
+        return rate, capacity, tokens, last_time
+
+    def _store(self, tokens, last_time):
+        for b, tok, last in zip(self.buckets, tokens.tolist(), last_time.tolist()):
+            b.tokens = tok
+            b.last_time = None if last != last else last
+
+    def allow(self, flow_ids, times):
+        """
+        Bool array: True where the cell got a token (consumes 1).
+        Cells with flow id -1 are not policed and always pass.
+        """
+        flow_ids = np.ascontiguousarray(flow_ids, dtype=np.int64)
+        times = np.ascontiguousarray(times, dtype=np.float64)
+        allowed = np.empty(len(flow_ids), dtype=np.bool_)
+        rate, capacity, tokens, last_time = self._load()
+        _bank_allow(flow_ids, times, rate, capacity, tokens, last_time, allowed)
+        self._store(tokens, last_time)
+        return allowed
+
+    def count(self, header_drop, flow_ids, payload_hit, is_mal, times, counts):
+        """Run the fused filter/stats kernel over a batch, accumulating into counts"""
+        rate, capacity, tokens, last_time = self._load()
+        _count_kernel(np.ascontiguousarray(header_drop, dtype=np.bool_),
+                      np.ascontiguousarray(flow_ids, dtype=np.int64),
+                      np.ascontiguousarray(payload_hit, dtype=np.bool_),
+                      np.ascontiguousarray(is_mal, dtype=np.bool_),
+                      np.ascontiguousarray(times, dtype=np.float64),
+                      rate, capacity, tokens, last_time, counts)
+        self._store(tokens, last_time)
+        return counts
+
 class ATMFilter:
     """
     Apply rules in this order:
@@ -85,14 +286,39 @@ class ATMFilter:
       3) PayloadRule -> drop if signature found
       4) forward otherwise
     """
+    LUT_MAX_ENTRIES = 1 << 16  # largest dense flow id table (max_vpi * max_vci)
+
     def __init__(self, header_rule:HeaderRule=None, payload_rule:PayloadRule=None, policer_cfg:dict=None):
         self.header_rule = header_rule if header_rule else HeaderRule()
         self.payload_rule = payload_rule if payload_rule else PayloadRule()
         # policer_cfg: dict { (vpi,vci): (rate, burst) }
-        self.policers = {}
+        # each policed flow gets a compact id into the TokenBucketBank
         policer_cfg = policer_cfg or {}
-        for k, (r,b) in policer_cfg.items():
-            self.policers[tuple(k)] = TokenBucket(r, b)
+        self.policers = TokenBucketBank([r for r, _ in policer_cfg.values()],
+                                        [b for _, b in policer_cfg.values()])
+        self._buckets = self.policers.buckets
+        self._max_vpi = max((v for v, _ in policer_cfg), default=-1) + 1
+        self._max_vci = max((c for _, c in policer_cfg), default=-1) + 1
+        # negative headers can't index the table (they would wrap onto another flow's slot)
+        in_range = all(v >= 0 and c >= 0 for v, c in policer_cfg)
+        if in_range and self._max_vpi * self._max_vci <= self.LUT_MAX_ENTRIES:
+            # dense (vpi, vci) -> flow id table; -1 for unpoliced flows
+            self._lut = np.full((self._max_vpi, self._max_vci), -1, dtype=np.int32)
+            for i, (v, c) in enumerate(policer_cfg):
+                self._lut[v, c] = i
+            # nested lists for the per-cell path: indexing a list from Python is
+            # much cheaper than indexing a numpy array one element at a time
+            self._lut_rows = self._lut.tolist()
+            self._flow_ids = None
+        else:
+            # header range too wide (or negative) for a table: packed key -> flow id dict per cell,
+            # sorted keys + searchsorted for batches
+            self._lut = self._lut_rows = None
+            self._flow_ids = {pack_key(v, c): i for i, (v, c) in enumerate(policer_cfg)}
+            flow_keys = np.fromiter(self._flow_ids, dtype=np.int64, count=len(self._flow_ids))
+            order = np.argsort(flow_keys)
+            self._sorted_flow_keys = flow_keys[order]
+            self._sorted_flow_ids = order.astype(np.int64)
 
     def process(self, cell:ATMCell, now:float):
         """
@@ -102,11 +328,71 @@ class ATMFilter:
         """
         if self.header_rule.check(cell):
             return ("drop", "header")
-        key = cell.header()
-        if key in self.policers:
-            allowed = self.policers[key].allow(now)
+        if self._lut_rows is not None:
+            vpi, vci = cell.vpi, cell.vci
+            fid = self._lut_rows[vpi][vci] if 0 <= vpi < self._max_vpi and 0 <= vci < self._max_vci else -1
+        else:
+            fid = self._flow_ids.get(cell.key, -1)
+        if fid >= 0:
+            allowed = self._buckets[fid].allow(now)
             if not allowed:
                 return ("drop", "policer")
         if self.payload_rule.check(cell):
             return ("drop", "payload")
         return ("forward", None)
+
+    def flow_ids_for(self, vpi, vci):
+        """Map (vpi, vci) arrays to policer flow ids (-1 for unpoliced flows)"""
+        if self._lut is None:
+            keys = pack_keys(vpi, vci)
+            pos = np.searchsorted(self._sorted_flow_keys, keys)
+            pos[pos == len(self._sorted_flow_keys)] = 0
+            return np.where(self._sorted_flow_keys[pos] == keys, self._sorted_flow_ids[pos], -1)
+        vpi = np.asarray(vpi)
+        vci = np.asarray(vci)
+        in_table = (vpi >= 0) & (vpi < self._max_vpi) & (vci >= 0) & (vci < self._max_vci)
+        if not in_table.any():
+            return np.full(len(vpi), -1, dtype=np.int64)
+        return np.where(in_table, self._lut[np.where(in_table, vpi, 0), np.where(in_table, vci, 0)], -1).astype(np.int64)
+
+    def process_batch(self, vpi, vci, payload_hit, times):
+        """
+        Batched variant of process() over parallel arrays (one entry per cell).
+         - payload_hit: bool array, True where the payload matches a signature
+         - times: float array of arrival times (same clock as process())
+        Returns (action, reason) int8 arrays using the ACTION_* / REASON_* codes.
+        Header and payload verdicts are computed as whole-array masks; only the
+        policer runs per cell (in TokenBucketBank's compiled kernel), since token
+        buckets carry state from cell to cell.
+        """
+        keys = pack_keys(vpi, vci)
+        header_drop = self.header_rule.deny_mask(keys)
+        fids = self.flow_ids_for(vpi, vci)
+        fids[header_drop] = -1  # header-denied cells never reach the policer
+        policer_drop = ~self.policers.allow(fids, times)
+        payload_drop = np.asarray(payload_hit, dtype=bool)
+        reason = np.select([header_drop, policer_drop, payload_drop],
+                           [REASON_HEADER, REASON_POLICER, REASON_PAYLOAD], REASON_NONE).astype(np.int8)
+        action = (reason != REASON_NONE).astype(np.int8)
+        return action, reason
+
+    def count_batch(self, vpi, vci, payload_hit, is_mal, times, counts=None):
+        """
+        Like process_batch, but only returns the simulation counters: an int64
+        array indexed by the STAT_* codes (accumulated into counts if given).
+        The whole per-cell loop runs in one compiled kernel when numba is installed.
+        """
+        if counts is None:
+            counts = np.zeros(N_STATS, dtype=np.int64)
+        keys = pack_keys(vpi, vci)
+        header_drop = self.header_rule.deny_mask(keys)
+        return self.policers.count(header_drop, self.flow_ids_for(vpi, vci), payload_hit, is_mal, times, counts)
+
+def stats_from_counts(counts) -> dict:
+    """Convert a STAT_* counter array into the {name: count} dict used by the simulators"""
+    return dict(zip(STAT_NAMES, counts.tolist()))
+
+try:  # compiled per-cell classes, built from _cfiltering.pyx via setup.py
+    from _cfiltering import ATMCell, TokenBucket
+except ImportError:
+    pass
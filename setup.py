@@ -0,0 +1,16 @@
+# setup.py
+"""
+Optional build of the compiled per-cell classes (_cfiltering.pyx):
+    python setup.py build_ext --inplace
+filtering.py falls back to its pure-Python classes when the extension isn't built.
+This only builds the extension next to the sources; it doesn't package the app,
+so `pip install .` is not a supported way to install it.
+"""
+
+from setuptools import setup
+from Cython.Build import cythonize
+
+setup(
+    name="atm-filter",
+    ext_modules=cythonize("_cfiltering.pyx", language_level=3),
+)
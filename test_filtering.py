@@ -0,0 +1,109 @@
+# test_filtering.py
+"""
+Batched filter paths (process_batch / count_batch) must agree with the
+per-cell ATMFilter.process on the same seeded traffic.
+"""
+
+import numpy as np
+import pytest
+from filtering import (ATMCell, HeaderRule, PayloadRule, ATMFilter,
+                       REASON_NAMES, N_STATS, stats_from_counts)
+from traffic import cell_count, generate_traffic_batches, make_payload, payload_hit_table, payload_hits
+
+POLICER_CFG = {
+    (0,10): (50.0, 20.0),
+    (2,40): (30.0, 10.0),
+}
+SMALL_DENY = [(1,30)]
+# more than HeaderRule.BITMAP_THRESHOLD entries, so the bitmap is used
+LARGE_DENY = [(1,30), (0,20)] + [(3, c) for c in range(100)]
+
+def make_filter(deny_list):
+    return ATMFilter(HeaderRule(deny_list), PayloadRule(["BADSIG_1"]), POLICER_CFG)
+
+def per_cell_reasons(deny_list, duration, rate, seed):
+    atm_filter = make_filter(deny_list)
+    reasons = []
+    for times, vpi, vci, is_mal, sig_id in generate_traffic_batches(duration, rate, 0.3, seed=seed):
+        for t, v, c, mal, sid in zip(times.tolist(), vpi.tolist(), vci.tolist(), is_mal.tolist(), sig_id.tolist()):
+            reasons.append(atm_filter.process(ATMCell(v, c, make_payload(mal, sid), mal), t)[1])
+    return reasons
+
+@pytest.mark.parametrize("deny_list", [SMALL_DENY, LARGE_DENY], ids=["set", "bitmap"])
+@pytest.mark.parametrize("rate", [500.0, 2000.0, 10000.0])
+def test_process_batch_matches_process(deny_list, rate):
+    assert (HeaderRule(deny_list)._bits is not None) == (deny_list is LARGE_DENY)
+    expected = per_cell_reasons(deny_list, 2.0, rate, seed=3)
+
+    atm_filter = make_filter(deny_list)
+    hit_table = payload_hit_table(atm_filter.payload_rule)
+    reasons = []
+    for times, vpi, vci, is_mal, sig_id in generate_traffic_batches(2.0, rate, 0.3, seed=3):
+        _, reason = atm_filter.process_batch(vpi, vci, payload_hits(hit_table, is_mal, sig_id), times)
+        reasons.extend(REASON_NAMES[r] for r in reason.tolist())
+    assert reasons == expected
+    assert 'policer' in expected and 'header' in expected
+
+@pytest.mark.parametrize("deny_list", [SMALL_DENY, LARGE_DENY], ids=["set", "bitmap"])
+@pytest.mark.parametrize("rate", [500.0, 2000.0, 10000.0])
+def test_count_batch_matches_process(deny_list, rate):
+    expected = per_cell_reasons(deny_list, 2.0, rate, seed=5)
+
+    atm_filter = make_filter(deny_list)
+    hit_table = payload_hit_table(atm_filter.payload_rule)
+    counts = np.zeros(N_STATS, dtype=np.int64)
+    for times, vpi, vci, is_mal, sig_id in generate_traffic_batches(2.0, rate, 0.3, seed=5):
+        atm_filter.count_batch(vpi, vci, payload_hits(hit_table, is_mal, sig_id), is_mal, times, counts)
+    stats = stats_from_counts(counts)
+    assert stats['total'] == len(expected)
+    assert stats['forwarded'] == expected.count(None)
+    for reason in ('header', 'policer', 'payload'):
+        assert stats['dropped_' + reason] == expected.count(reason)
+
+def test_negative_policer_header_keeps_its_own_bucket():
+    # (-1,10) must not alias the table slot of (2,10)
+    atm_filter = ATMFilter(policer_cfg={(2,10): (1.0, 100.0), (-1,10): (1.0, 1.0)})
+    assert [atm_filter.process(ATMCell(2, 10, "x"), 0.0)[1] for _ in range(3)] == [None, None, None]
+    assert [atm_filter.process(ATMCell(-1, 10, "x"), 0.0)[1] for _ in range(2)] == [None, 'policer']
+
+    atm_filter = ATMFilter(policer_cfg={(2,10): (1.0, 100.0), (-1,10): (1.0, 1.0)})
+    vpi = np.array([2, 2, 2, -1, -1])
+    vci = np.full(5, 10)
+    _, reason = atm_filter.process_batch(vpi, vci, np.zeros(5, dtype=bool), np.zeros(5))
+    assert [REASON_NAMES[r] for r in reason.tolist()] == [None, None, None, None, 'policer']
+
+def test_batched_policer_uses_current_bucket_settings():
+    atm_filter = ATMFilter(policer_cfg={(0,10): (1.0, 1.0)})
+    atm_filter.policers.buckets[0].capacity = 3.0
+    atm_filter.policers.buckets[0].tokens = 3.0
+    _, reason = atm_filter.process_batch(np.zeros(4, dtype=np.int64), np.full(4, 10), np.zeros(4, dtype=bool), np.zeros(4))
+    assert [REASON_NAMES[r] for r in reason.tolist()] == [None, None, None, 'policer']
+
+def test_cell_count_is_exact_at_rounding_boundaries():
+    assert cell_count(1.1, 200) == 220  # 1.1 * 200 == 220.00000000000003
+    assert cell_count(5, 20000) == 100000
+    assert cell_count(0, 10) == 0
+
+def test_header_rule_bitmap_follows_add_and_remove():
+    rule = HeaderRule([(3, c) for c in range(HeaderRule.BITMAP_THRESHOLD)])
+    probes = [(3, c) for c in range(HeaderRule.BITMAP_THRESHOLD + 3)] + [(0, 10), (1, 30)]
+    probe_keys = np.array([(v << 16) | c for v, c in probes], dtype=np.int64)
+
+    def assert_matches_deny_set():
+        expected = [k in rule.deny_set for k in probe_keys.tolist()]
+        assert [rule.check(ATMCell(v, c, "")) for v, c in probes] == expected
+        assert rule.deny_mask(probe_keys).tolist() == expected
+
+    steps = [
+        (rule.add, (3, 64), True),     # 65 entries: bitmap built
+        (rule.add, (1, 30), True),
+        (rule.remove, (3, 0), True),   # cleared in the live bitmap
+        (rule.remove, (1, 30), False), # back to 64: bitmap dropped
+        (rule.add, (3, 65), True),     # rebuilt from deny_set
+    ]
+    assert rule._bits is None
+    assert_matches_deny_set()
+    for op, header, has_bitmap in steps:
+        op(header)
+        assert (rule._bits is not None) == has_bitmap
+        assert_matches_deny_set()
@@ -0,0 +1,89 @@
+# traffic.py
+"""
+Synthetic ATM traffic shared by the simulators (atm_sim.py CLI and app.py dashboard):
+ - generate_traffic_batches: numpy arrays of cells, one batch at a time
+ - generate_traffic: the same traffic as (time_offset, ATMCell) pairs
+ - payload_hit_table / payload_hits: payload signature verdicts for generated cells
+"""
+
+import numpy as np
+from filtering import ATMCell
+
+# flows the traffic generators pick from
+VPI_CHOICES = np.array([0,1,2])
+VCI_CHOICES = np.array([10,20,30,40])
+BATCH_SIZE = 4096
+SEED_MODULUS = 1 << 64
+
+# generated payloads: legitimate cells carry NORMAL_PAYLOAD, malicious cells
+# MAL_PAYLOAD_PREFIX followed by a sig_id in 0..N_SIG_IDS-1
+NORMAL_PAYLOAD = "NORMALDATA"
+MAL_PAYLOAD_PREFIX = "BADSIG_"
+N_SIG_IDS = 1000
+
+def make_payload(is_mal:bool, sig_id:int) -> str:
+    """Payload string of a generated cell"""
+    return MAL_PAYLOAD_PREFIX + str(sig_id) if is_mal else NORMAL_PAYLOAD
+
+def cell_count(duration_sec, total_rate) -> int:
+    """Number of cells k with arrival time k / total_rate < duration_sec"""
+    n = int(np.ceil(duration_sec * total_rate))
+    # the product can round past an exact boundary (1.1 * 200 == 220.00000000000003)
+    while n > 0 and (n - 1) / total_rate >= duration_sec:
+        n -= 1
+    while n / total_rate < duration_sec:
+        n += 1
+    return n
+
+def generate_traffic_batches(duration_sec=5.0, total_rate=200.0, malicious_fraction=0.1, seed=None, batch_size=BATCH_SIZE):
+    """
+    Generator that yields (times, vpi, vci, is_mal, sig_id) arrays of up to batch_size cells.
+    Same deterministic spacing as generate_traffic, but each field is drawn for the whole
+    batch with a single numpy.random.Generator call instead of once per cell.
+    sig_id is the numeric suffix of a malicious payload (see make_payload).
+    Any int seed is accepted (like random.seed); negative seeds are folded into
+    numpy's non-negative seed range modulo SEED_MODULUS.
+    """
+    rng = np.random.default_rng(None if seed is None else int(seed) % SEED_MODULUS)
+    # cell k arrives at k / total_rate; index-based times don't drift over long runs
+    n_total = cell_count(duration_sec, total_rate)
+    for start in range(0, n_total, batch_size):
+        n = min(batch_size, n_total - start)
+        times = np.arange(start, start + n, dtype=np.float64) / total_rate
+        vpi = VPI_CHOICES[rng.integers(0, len(VPI_CHOICES), n)]
+        vci = VCI_CHOICES[rng.integers(0, len(VCI_CHOICES), n)]
+        is_mal = rng.random(n) < malicious_fraction
+        sig_id = rng.integers(0, N_SIG_IDS, n)
+        yield times, vpi, vci, is_mal, sig_id
+
+def generate_traffic(duration_sec=5.0, total_rate=200.0, malicious_fraction=0.1, seed=None):
+    """
+    Generator that yields (time_offset, ATMCell) up to duration_sec.
+    total_rate = cells per second (lambda). Inter-arrival = 1/total_rate.
+    We simulate deterministic spacing for reproducibility.
+    Cells are materialized lazily from generate_traffic_batches; the same ATMCell
+    object is updated and re-yielded each time, so consumers must not keep it.
+    """
+    cell = ATMCell._raw(0, 0, "", False)
+    for times, vpi, vci, is_mal, sig_id in generate_traffic_batches(duration_sec, total_rate, malicious_fraction, seed):
+        for t, v, c, mal, sid in zip(times.tolist(), vpi.tolist(), vci.tolist(), is_mal.tolist(), sig_id.tolist()):
+            cell.vpi = v
+            cell.vci = c
+            cell.payload = make_payload(mal, sid)
+            cell.is_malicious = mal
+            cell.key = (v << 16) | c
+            yield t, cell
+
+def payload_hit_table(payload_rule):
+    """
+    (normal_hit, mal_hits) for every payload the generators can produce, so each
+    distinct payload is matched once per run instead of once per cell.
+    """
+    normal_hit = payload_rule.matches(NORMAL_PAYLOAD)
+    mal_hits = np.array([payload_rule.matches(make_payload(True, i)) for i in range(N_SIG_IDS)])
+    return normal_hit, mal_hits
+
+def payload_hits(hit_table, is_mal, sig_id):
+    """Bool mask of payload signature hits for a generated batch (see payload_hit_table)"""
+    normal_hit, mal_hits = hit_table
+    return np.where(is_mal, mal_hits[sig_id], normal_hit)